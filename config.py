@@ -0,0 +1,31 @@
+import os
+from dotenv import load_dotenv
+
+# -----------------------------
+# Load Environment Variables & Configuration
+# -----------------------------
+load_dotenv()
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+FLASK_PASSWORD = os.getenv("FLASK_PASSWORD")
+# A stable key keeps panel sessions valid across restarts and between worker processes
+FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY")
+# Turn on when the panel is only reached over HTTPS; browsers drop Secure cookies on plain HTTP
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "false").lower() in ("true", "1", "yes")
+WEB_REQUEST_URL = os.getenv("WEB_REQUEST_URL")
+# The web control panel (and its Flask import) can be switched off for bot-only deployments
+WEB_ENABLED = os.getenv("WEB_ENABLED", "true").lower() in ("true", "1", "yes")
+WEB_PORT = int(os.getenv("WEB_PORT", "8080"))
+# Each open /log_stream or /view viewer holds one of these panel threads while it stays open
+WEB_THREADS = int(os.getenv("WEB_THREADS", "32"))
+# Set when the panel sits behind a proxy that honours X-Sendfile, so it ships file bytes itself
+USE_X_SENDFILE = os.getenv("USE_X_SENDFILE", "false").lower() in ("true", "1", "yes")
+# Private directory (created 0700) for finished ZIP downloads; unset disables the cache.
+# It must lie outside the panel's home directory (the bot's cwd), or the cache is refused.
+# Only worth it when the archived tree sits still between downloads, e.g. LOGS_DIR moved out of it
+ZIP_CACHE_DIR = os.getenv("ZIP_CACHE_DIR")
+
+MODEL_NAME = "gemini-2.5-flash-lite"
+LOGS_DIR = "logs"
+# Per-user chat transcripts are logged at INFO; raise to WARNING to turn them off
+USER_LOG_LEVEL = os.getenv("USER_LOG_LEVEL", "INFO").upper()
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+
+from config import GEMINI_API_KEY, MODEL_NAME
+from lru import LRUOrderedDict
+
+__all__ = ["model", "system_instruction", "generate", "generate_cached"]
+
+app_log = logging.getLogger("bot")
+
+# -----------------------------
+# Gemini Client
+# -----------------------------
+# The one shared model object; chat sessions and the command cache below are built on it.
+try:
+    import google.generativeai as genai
+    from google.api_core import exceptions
+    genai.configure(api_key=GEMINI_API_KEY)
+
+    system_instruction = r"""You are a Telegram bot offering study group help.
+- Always use Telegram MarkdownV2 formatting.
+- Keep replies short, structured, and engaging.
+- Use bullet points, examples, and emojis.
+- One or two lines unless a longer answer is explicitly needed.
+- Never use LaTeX or unsupported markup.
+- Escape reserved characters to avoid formatting errors.
+
+📖 Telegram MarkdownV2 Formatting Guide:
+1. *Bold* → `*bold*`
+2. _Italic_ → `_italic_`
+3. __Underline__ → `__underline__`
+4. ~Strikethrough~ → `~strikethrough~`
+5. ||Spoiler|| → `||hidden text||`
+6. Inline code → `` `code` ``
+7. Multiline code block → ```\ncode here\n```
+8. [Inline link](https://example.com) → `[text](https://example.com)`
+9. Mention user → `[Name](tg://user?id=USER_ID)`
+10. Escape reserved characters with a backslash `\` before these:
+    `_ * [ ] ( ) ~ ` > # + - = | { } . !`
+
+⚡ Example:
+Hello *world*\! Visit [Google](https://google.com) for more info.
+"""
+
+    model = genai.GenerativeModel(
+        MODEL_NAME,
+        system_instruction=system_instruction
+    )
+    app_log.info(f"Gemini AI client configured successfully with model: {MODEL_NAME}")
+except Exception as e:
+    app_log.critical(f"Failed to configure Gemini AI: {e}", exc_info=True)
+    exit()
+
+# -----------------------------
+# Chat Sessions
+# -----------------------------
+MAX_CHAT_SESSIONS = 1000
+MAX_HISTORY_MESSAGES = 6
+chat_locks: dict[int, asyncio.Lock] = {}
+chat_sessions = LRUOrderedDict(MAX_CHAT_SESSIONS, on_evict=lambda chat_id, _: chat_locks.pop(chat_id, None))
+
+def get_chat_session(chat_id: int) -> genai.ChatSession:
+    """Returns the chat's Gemini session, evicting the least recently used one when full."""
+    chat_session = chat_sessions.get(chat_id)
+    if chat_session is None:
+        chat_session = model.start_chat(history=[])
+        chat_sessions[chat_id] = chat_session
+    return chat_session
+
+# -----------------------------
+# Answer Generation
+# -----------------------------
+# Calls are native async, so a stalled request would hold a worker (and its chat's lock)
+# indefinitely; the deadline surfaces as a GoogleAPICallError like any other API failure
+REQUEST_OPTIONS = {"timeout": 60}
+
+async def generate(chat_id: int, prompt: str) -> str:
+    """
+    Generates an answer using Gemini, reusing the chat's session so only the new prompt is added.
+    """
+    # Workers run concurrently, so serialize turns within a chat to keep its session consistent
+    async with chat_locks.setdefault(chat_id, asyncio.Lock()):
+        chat_session = get_chat_session(chat_id)
+        # Kept so a failed turn can be undone; once a blocked response is pending, reading
+        # chat_session.history raises, so it can't be rolled back by slicing afterwards
+        previous_history = list(chat_session.history)
+        try:
+            response = await chat_session.send_message_async(prompt, request_options=REQUEST_OPTIONS)
+            full_response_text = response.text
+
+            # history is the session's own list, so trim it in place
+            del chat_session.history[:-MAX_HISTORY_MESSAGES]
+
+            return full_response_text
+
+        except exceptions.GoogleAPICallError as e:
+            app_log.error(f"Gemini API Call Error: {e}")
+            # Drop the failed exchange so it doesn't pollute the session
+            chat_session.history = previous_history
+            return "API Error: Could not get a response."
+        except Exception as e:
+            app_log.error(f"Unexpected error in Gemini generation: {e}", exc_info=True)
+            chat_session.history = previous_history
+            return "An unexpected error occurred."
+
+STATIC_ANSWER_TTL = 600
+static_answer_cache: dict[str, tuple[float, str]] = {}
+
+async def generate_cached(prompt: str) -> str:
+    """
+    Answers a fixed command prompt, reusing a recent answer instead of calling Gemini again.
+    """
+    cached = static_answer_cache.get(prompt)
+    if cached and time.monotonic() - cached[0] < STATIC_ANSWER_TTL:
+        return cached[1]
+    try:
+        response = await model.generate_content_async(prompt, request_options=REQUEST_OPTIONS)
+        full_response_text = response.text
+        if full_response_text.strip():
+            # Errors are returned below without being cached, so the next call retries
+            static_answer_cache[prompt] = (time.monotonic(), full_response_text)
+        return full_response_text
+    except exceptions.GoogleAPICallError as e:
+        app_log.error(f"Gemini API Call Error: {e}")
+        return "API Error: Could not get a response."
+    except Exception as e:
+        app_log.error(f"Unexpected error in Gemini generation: {e}", exc_info=True)
+        return "An unexpected error occurred."
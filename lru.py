@@ -0,0 +1,25 @@
+from collections import OrderedDict
+
+class LRUOrderedDict(OrderedDict):
+    """OrderedDict capped at max_size that evicts its least recently used entry, calling on_evict for it."""
+
+    def __init__(self, max_size: int, on_evict=None):
+        super().__init__()
+        self.max_size = max_size
+        self.on_evict = on_evict
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            evicted_key, evicted_value = self.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted_key, evicted_value)
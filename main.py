@@ -1,56 +1,76 @@
 import os
 import re
+import json
 import asyncio
+import atexit
+import queue
 import logging
-from logging.handlers import RotatingFileHandler
-from collections import deque
-from dotenv import load_dotenv
+from logging.handlers import RotatingFileHandler, MemoryHandler, QueueHandler, QueueListener
 import threading
-import time
-from flask import Flask, render_template_string, Response, jsonify, send_from_directory, send_file, request, redirect, url_for, session
-from functools import wraps
-import zipfile
-import io
-import requests
 
-# -----------------------------
-# Load Environment Variables & Configuration
-# -----------------------------
-load_dotenv()
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-FLASK_PASSWORD = os.getenv("FLASK_PASSWORD")
-WEB_REQUEST_URL = os.getenv("WEB_REQUEST_URL")
-
-MODEL_NAME = "gemini-2.5-flash-lite"
+from config import TELEGRAM_TOKEN, GEMINI_API_KEY, FLASK_PASSWORD, WEB_ENABLED, LOGS_DIR, USER_LOG_LEVEL
+from lru import LRUOrderedDict
 
-if not TELEGRAM_TOKEN or not GEMINI_API_KEY or not FLASK_PASSWORD:
-    print("FATAL ERROR: TELEGRAM_BOT_TOKEN, GEMINI_API_KEY, and FLASK_PASSWORD must be set in the .env file.")
+if not TELEGRAM_TOKEN or not GEMINI_API_KEY:
+    print("FATAL ERROR: TELEGRAM_BOT_TOKEN and GEMINI_API_KEY must be set in the .env file.")
+    exit()
+if WEB_ENABLED and not FLASK_PASSWORD:
+    print("FATAL ERROR: FLASK_PASSWORD must be set in the .env file (or set WEB_ENABLED=false).")
     exit()
 
 # -----------------------------
 # Central Logging Setup
 # -----------------------------
-LOGS_DIR = "logs"
 os.makedirs(LOGS_DIR, exist_ok=True)
 master_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO)
-
-master_file_handler = RotatingFileHandler(
+# Third-party loggers inherit WARNING and drop INFO/DEBUG calls before building a record
+root_logger.setLevel(logging.WARNING)
+app_log = logging.getLogger("bot")
+app_log.setLevel(logging.INFO)
+
+class FastRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that skips the per-record stat calls while the file is well under maxBytes."""
+
+    def shouldRollover(self, record):
+        if self.stream is None or self.maxBytes <= 0:
+            return False
+        msg = "%s\n" % self.format(record)
+        if self.stream.tell() + len(msg) < self.maxBytes:
+            return False
+        return super().shouldRollover(record)
+
+master_file_handler = FastRotatingFileHandler(
     os.path.join(LOGS_DIR, "console.log"), maxBytes=10*1024*1024, backupCount=5, encoding="utf-8"
 )
 master_file_handler.setFormatter(master_formatter)
-root_logger.addHandler(master_file_handler)
 
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(master_formatter)
-root_logger.addHandler(console_handler)
 
-logging.getLogger("httpx").setLevel(logging.WARNING)
-logging.getLogger("telegram").setLevel(logging.WARNING)
-logging.getLogger("werkzeug").setLevel(logging.WARNING)
-logging.getLogger("requests").setLevel(logging.WARNING)
+class LogRouter(logging.Handler):
+    """Runs on the log listener thread, sending each record to the shared handlers and its user's file."""
+
+    def __init__(self, *shared_handlers: logging.Handler):
+        super().__init__()
+        self.shared_handlers = shared_handlers
+        self.user_handlers: dict[str, logging.Handler] = {}
+
+    def emit(self, record):
+        user_handler = self.user_handlers.get(record.name)
+        if user_handler is not None:
+            user_handler.handle(record)
+        for handler in self.shared_handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+# Log calls only enqueue the record; formatting and disk I/O happen on the listener thread
+log_queue = queue.Queue(-1)
+log_router = LogRouter(master_file_handler, console_handler)
+root_logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, log_router, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 web_request_logger = logging.getLogger('WebRequestLogger')
 web_request_logger.setLevel(logging.INFO)
@@ -61,124 +81,175 @@ web_request_handler = RotatingFileHandler(
 web_request_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 web_request_logger.addHandler(web_request_handler)
 
-user_loggers = {}
+def _close_user_logger(chat_id: int, logger: logging.Logger):
+    """Flushes and closes an evicted user's log file so idle chats don't hold file descriptors."""
+    buffer_handler = log_router.user_handlers.pop(logger.name, None)
+    if buffer_handler is not None:
+        file_handler = buffer_handler.target
+        buffer_handler.close()
+        file_handler.close()
+
+MAX_USER_LOGGERS = 5000
+user_loggers = LRUOrderedDict(MAX_USER_LOGGERS, on_evict=_close_user_logger)
+# Guards the slow path so two first messages from one chat can't create two file handlers
+user_loggers_lock = threading.Lock()
+USER_LOG_BUFFER_CAPACITY = 1024
+USER_LOG_FLUSH_INTERVAL = 30
+
+# Deletes characters that aren't allowed in filenames and turns spaces into underscores
+_FILENAME_TABLE = str.maketrans(" ", "_", '\\/*?:"<>|')
 
 def sanitize_filename(name: str) -> str:
-    name = re.sub(r'[\\/*?:"<>|]', "", name).replace(" ", "_")
-    return name
+    return name.translate(_FILENAME_TABLE)
 
 def get_user_logger(chat_id: int, full_name: str) -> logging.Logger:
-    if chat_id in user_loggers:
-        return user_loggers[chat_id]
-    logger = logging.getLogger(str(chat_id))
-    logger.setLevel(logging.INFO)
-    logger.propagate = True
-    user_file_formatter = logging.Formatter('%(asctime)s - %(message)s')
-    safe_fullname = sanitize_filename(full_name)
-    log_file_path = os.path.join(LOGS_DIR, f"{safe_fullname}_{chat_id}.log")
-    file_handler = RotatingFileHandler(log_file_path, maxBytes=10*1024*1024, backupCount=5, encoding="utf-8")
-    file_handler.setFormatter(user_file_formatter)
-    logger.addHandler(file_handler)
-    user_loggers[chat_id] = logger
-    return logger
+    logger = user_loggers.get(chat_id)
+    if logger is not None:
+        return logger
+    with user_loggers_lock:
+        logger = user_loggers.get(chat_id)
+        if logger is not None:
+            return logger
+        logger = logging.getLogger(str(chat_id))
+        logger.setLevel(USER_LOG_LEVEL)
+        logger.propagate = True
+        user_file_formatter = logging.Formatter('%(asctime)s - %(message)s')
+        safe_fullname = sanitize_filename(full_name)
+        log_file_path = os.path.join(LOGS_DIR, f"{safe_fullname}_{chat_id}.log")
+        # delay=True: the file is only opened when the first buffered line is written out
+        file_handler = FastRotatingFileHandler(
+            log_file_path, maxBytes=10*1024*1024, backupCount=5, encoding="utf-8", delay=True
+        )
+        file_handler.setFormatter(user_file_formatter)
+        # Buffer user lines in memory and write them out in batches (see flush_user_logs)
+        buffer_handler = MemoryHandler(
+            capacity=USER_LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler, flushOnClose=True
+        )
+        log_router.user_handlers[logger.name] = buffer_handler
+        user_loggers[chat_id] = logger
+        return logger
+
+def _flush_user_log_buffers():
+    for buffer_handler in list(log_router.user_handlers.values()):
+        buffer_handler.flush()
+
+async def flush_user_logs():
+    """Periodically writes out the buffered per-user log lines, off the event loop."""
+    while True:
+        await asyncio.sleep(USER_LOG_FLUSH_INTERVAL)
+        await asyncio.to_thread(_flush_user_log_buffers)
 
 # -----------------------------
 # Gemini Client
 # -----------------------------
-try:
-    import google.generativeai as genai
-    from google.api_core import exceptions
-    genai.configure(api_key=GEMINI_API_KEY)
-
-    system_instruction = r"""You are a Telegram bot offering study group help.
-- Always use Telegram MarkdownV2 formatting.
-- Keep replies short, structured, and engaging.
-- Use bullet points, examples, and emojis.
-- One or two lines unless a longer answer is explicitly needed.
-- Never use LaTeX or unsupported markup.
-- Escape reserved characters to avoid formatting errors.
-
-📖 Telegram MarkdownV2 Formatting Guide:
-1. *Bold* → `*bold*`
-2. _Italic_ → `_italic_`
-3. __Underline__ → `__underline__`
-4. ~Strikethrough~ → `~strikethrough~`
-5. ||Spoiler|| → `||hidden text||`
-6. Inline code → `` `code` ``
-7. Multiline code block → ```\ncode here\n```
-8. [Inline link](https://example.com) → `[text](https://example.com)`
-9. Mention user → `[Name](tg://user?id=USER_ID)`
-10. Escape reserved characters with a backslash `\` before these:
-    `_ * [ ] ( ) ~ ` > # + - = | { } . !`
-
-⚡ Example:
-Hello *world*\! Visit [Google](https://google.com) for more info.
-"""
-
-    gemini_model = genai.GenerativeModel(
-        MODEL_NAME,
-        system_instruction=system_instruction
-    )
-    root_logger.info(f"Gemini AI client configured successfully with model: {MODEL_NAME}")
-except Exception as e:
-    root_logger.critical(f"Failed to configure Gemini AI: {e}", exc_info=True)
-    exit()
+from gemini_client import generate, generate_cached
 
 # -----------------------------
 # Telegram Bot Imports
 # -----------------------------
 from telegram import Update
 from telegram.constants import ChatAction, ChatType
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+from telegram.ext import AIORateLimiter, Application, CommandHandler, ContextTypes, MessageHandler, TypeHandler, filters
 from telegram.error import BadRequest
 
 # -----------------------------
 # Bot State Management (Reply Modes)
 # -----------------------------
-chat_reply_modes = {}
+REPLY_MODES_FILE = "reply_modes.json"
+# Only groups switched to mention-only mode are stored (absent means "all messages"),
+# and the least recently active ones are dropped past the cap
+MAX_REPLY_MODES = 10_000
+
+def load_reply_modes() -> LRUOrderedDict:
+    """Loads the saved per-group reply modes so they survive restarts."""
+    reply_modes = LRUOrderedDict(MAX_REPLY_MODES)
+    try:
+        with open(REPLY_MODES_FILE, 'r', encoding='utf-8') as f:
+            for chat_id, mode in json.load(f).items():
+                if mode:
+                    reply_modes[int(chat_id)] = True
+    except FileNotFoundError:
+        pass
+    except (ValueError, OSError) as e:
+        app_log.error(f"Could not load reply modes from {REPLY_MODES_FILE}: {e}")
+    return reply_modes
+
+def save_reply_modes():
+    tmp_path = f"{REPLY_MODES_FILE}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(chat_reply_modes, f)
+        os.replace(tmp_path, REPLY_MODES_FILE)
+    except OSError as e:
+        app_log.error(f"Could not save reply modes to {REPLY_MODES_FILE}: {e}")
+
+chat_reply_modes = load_reply_modes()
 
 # -----------------------------
 # Gemini & Telegram Interaction Helpers
 # -----------------------------
-def generate_gemini_answer(prompt: str, chat_history: deque) -> str:
+# Keeps each logged reply on a single line
+_NEWLINES_TO_SPACES = str.maketrans({"\n": " ", "\r": " "})
+
+GEMINI_WORKERS = 8
+WORK_QUEUE_SIZE = 200
+work_queue: asyncio.Queue = asyncio.Queue(maxsize=WORK_QUEUE_SIZE)
+background_tasks: list[asyncio.Task] = []
+
+async def generate_and_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str, use_cache: bool = False):
     """
-    Generates an answer using Gemini, maintaining a specific chat's history.
+    Queues a prompt for the Gemini workers, replying straight away if the queue is full.
+    Fixed command prompts pass use_cache=True to share a recent answer across chats.
     """
-    chat_history.append({'role': 'user', 'parts': [prompt]})
+    # Enqueue before awaiting anything so concurrent updates from one chat keep their order
     try:
-        # Pass the history from the deque to the model
-        chat_session = gemini_model.start_chat(history=list(chat_history))
-        response = chat_session.send_message(prompt)
-        full_response_text = response.text
-
-        if full_response_text.strip():
-            # Add the model's response back to the history deque
-            chat_history.append({'role': 'model', 'parts': [full_response_text]})
-
-        return full_response_text
-
-    except exceptions.GoogleAPICallError as e:
-        root_logger.error(f"Gemini API Call Error: {e}")
-        # Remove the user's prompt from history if the API call failed
-        chat_history.pop()
-        return "API Error: Could not get a response."
-    except Exception as e:
-        root_logger.error(f"Unexpected error in Gemini generation: {e}", exc_info=True)
-        # Remove the user's prompt from history if an unknown error occurred
-        chat_history.pop()
-        return "An unexpected error occurred."
+        work_queue.put_nowait((update, context, prompt, use_cache))
+    except asyncio.QueueFull:
+        app_log.warning(f"Work queue full, turning away a message from chat {update.effective_chat.id}.")
+        await update.message.reply_text("I'm answering a lot of questions right now\\. Please try again in a moment\\.", parse_mode='MarkdownV2')
+        return
+    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+
+PROMPT_BATCH_DELAY = 0.8
+# Keyed by (chat_id, user_id): in a group, only one member's own burst is merged, and the
+# answer goes back to that member (the Gemini session stays shared per chat)
+pending_prompts: dict[tuple[int, int], list[str]] = {}
+pending_flushes: dict[tuple[int, int], asyncio.TimerHandle] = {}
 
-async def generate_and_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str):
+async def batch_and_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str):
     """
-    Handles getting a response from Gemini and sending it, with a safety net for MarkdownV2 escaping.
+    Buffers a user's messages in a chat for a short window so a quick burst becomes a single Gemini call.
+    A message ending in '?' is treated as a direct question and flushes the buffer right away.
     """
-    if 'history' not in context.chat_data:
-        context.chat_data['history'] = deque(maxlen=20)
-    chat_history = context.chat_data['history']
+    key = (update.effective_chat.id, update.effective_user.id)
+    pending_prompts.setdefault(key, []).append(prompt)
+    timer = pending_flushes.pop(key, None)
+    if timer:
+        timer.cancel()
+    if prompt.rstrip().endswith("?"):
+        await flush_prompts(update, context)
+        return
+    pending_flushes[key] = asyncio.get_running_loop().call_later(
+        PROMPT_BATCH_DELAY, lambda: context.application.create_task(flush_prompts(update, context))
+    )
 
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+async def flush_prompts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sends a user's buffered messages as one prompt, replying to the latest of them."""
+    key = (update.effective_chat.id, update.effective_user.id)
+    pending_flushes.pop(key, None)
+    prompts = pending_prompts.pop(key, None)
+    if prompts:
+        await generate_and_reply(update, context, "\n\n".join(prompts))
 
-    raw_answer = await asyncio.to_thread(generate_gemini_answer, prompt, chat_history)
+async def answer_and_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str, use_cache: bool):
+    """
+    Gets a response from Gemini and sends it, with a safety net for MarkdownV2 escaping.
+    """
+    chat_id = update.effective_chat.id
+    if use_cache:
+        raw_answer = await generate_cached(prompt)
+    else:
+        raw_answer = await generate(chat_id, prompt)
     
     # ** THE FIX IS HERE **
     # Safety net: The model should handle escaping, but we apply a regex to catch common mistakes
@@ -190,29 +261,40 @@ async def generate_and_reply(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await update.message.reply_text(safe_answer, parse_mode="MarkdownV2")
     except BadRequest as e:
         # If the safety net fails, log the error and send a clean fallback message.
-        root_logger.error(f"MarkdownV2 parsing failed despite safety net: {e}. Original text from model: {raw_answer.strip()}")
+        app_log.error(f"MarkdownV2 parsing failed despite safety net: {e}. Original text from model: {raw_answer.strip()}")
         await update.message.reply_text("There was a formatting error in the response\\. Please try again\\.")
 
-    # Log the bot's reply
-    user_logger = get_user_logger(update.message.chat.id, update.message.from_user.full_name)
-    user_logger.info(f"BOT: {' '.join(safe_answer.splitlines())}")
-
+    # Log the bot's reply next to the message that prompted it
+    user_logger = context.user_data.get("_logger") or get_user_logger(update.message.from_user.id, update.message.from_user.full_name)
+    if user_logger.isEnabledFor(logging.INFO):
+        user_logger.info(f"BOT: {safe_answer.translate(_NEWLINES_TO_SPACES)}")
 
-def log_user_message(func):
-    """Decorator to log incoming user messages."""
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if not update.message or not update.message.text: return
-        user = update.message.from_user
-        user_logger = get_user_logger(user.id, user.full_name)
+async def gemini_worker():
+    """Long-lived consumer that answers queued prompts one at a time."""
+    while True:
+        update, context, prompt, use_cache = await work_queue.get()
+        try:
+            await answer_and_reply(update, context, prompt, use_cache)
+        except Exception as e:
+            app_log.error(f"Gemini worker failed to answer a message: {e}", exc_info=True)
+        finally:
+            work_queue.task_done()
+
+
+async def log_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Logs incoming user messages once per update, ahead of the command and message handlers."""
+    if not update.message or not update.message.text: return
+    user = update.message.from_user
+    user_logger = get_user_logger(user.id, user.full_name)
+    context.user_data["_logger"] = user_logger
+    # Skip building the line at all when transcripts are turned off
+    if user_logger.isEnabledFor(logging.INFO):
         username_str = f"(@{user.username})" if user.username else ""
         user_logger.info(f"USER {username_str}: {update.message.text}")
-        return await func(update, context)
-    return wrapper
 
 # -----------------------------
 # Command and Message Handlers
 # -----------------------------
-@log_user_message
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Static messages must also be properly escaped for MarkdownV2...
     await update.message.reply_text(
@@ -220,26 +302,24 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='MarkdownV2'
     )
 
-@log_user_message
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     if chat.type == ChatType.PRIVATE:
-        await generate_and_reply(update, context, update.message.text)
+        await batch_and_reply(update, context, update.message.text)
         return
 
     mention_only_mode = chat_reply_modes.get(chat.id, False)
     if mention_only_mode:
         message = update.message
-        bot_username = f"@{context.bot.username}"
+        mention_re = context.bot_data["mention_re"]
         is_reply_to_bot = message.reply_to_message and message.reply_to_message.from_user.id == context.bot.id
-        bot_is_mentioned = bot_username in (message.text or "")
+        bot_is_mentioned = mention_re.search(message.text) is not None
         if is_reply_to_bot or bot_is_mentioned:
-            prompt = message.text.replace(bot_username, "").strip()
-            await generate_and_reply(update, context, prompt)
+            prompt = mention_re.sub("", message.text).strip()
+            await batch_and_reply(update, context, prompt)
     else:
-        await generate_and_reply(update, context, update.message.text)
+        await batch_and_reply(update, context, update.message.text)
 
-@log_user_message
 async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     question = " ".join(context.args)
     if not question:
@@ -247,7 +327,6 @@ async def ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     await generate_and_reply(update, context, question)
 
-@log_user_message
 async def set_reply_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
     if chat.type == ChatType.PRIVATE:
@@ -264,34 +343,28 @@ async def set_reply_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_mode_str = context.args[0].lower()
     if new_mode_str in ["true", "on", "yes"]:
         chat_reply_modes[chat.id] = True
+        save_reply_modes()
         await update.message.reply_text("✅ Bot will now only reply when mentioned or replied to\\.", parse_mode='MarkdownV2')
     elif new_mode_str in ["false", "off", "no"]:
-        chat_reply_modes[chat.id] = False
+        chat_reply_modes.pop(chat.id, None)
+        save_reply_modes()
         await update.message.reply_text("📢 Bot will now reply to all messages in the group\\.", parse_mode='MarkdownV2')
     else:
         await update.message.reply_text("Invalid option\\. Please use `true` or `false`\\.", parse_mode='MarkdownV2')
 
-@log_user_message
-async def tip(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await generate_and_reply(update, context, "Give a short, practical study tip.")
-
-@log_user_message
-async def example(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await generate_and_reply(update, context, "Provide a short example question with its answer.")
+STATIC_PROMPTS = {
+    "tip": "Give a short, practical study tip.",
+    "example": "Provide a short example question with its answer.",
+    "quiz": "Give a short quiz question with a hidden answer.",
+    "funfact": "Share a quick, fun fact about learning.",
+    "rules": "Write 4 concise, polite group study rules with emojis.",
+}
 
-@log_user_message
-async def quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await generate_and_reply(update, context, "Give a short quiz question with a hidden answer.")
+async def static_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answers every fixed-prompt command from one handler, e.g. `/tip` or `/quiz@BotName`."""
+    command = update.message.text.split()[0][1:].split('@')[0].lower()
+    await generate_and_reply(update, context, STATIC_PROMPTS[command], use_cache=True)
 
-@log_user_message
-async def funfact(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await generate_and_reply(update, context, "Share a quick, fun fact about learning.")
-
-@log_user_message
-async def rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await generate_and_reply(update, context, "Write 4 concise, polite group study rules with emojis.")
-
-@log_user_message
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = (
         "Here's what I can do:\n\n"
@@ -309,7 +382,6 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(help_text, parse_mode='MarkdownV2')
 
-@log_user_message
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "I am a study group assistant bot powered by Google's Gemini AI\\.",
@@ -319,436 +391,79 @@ async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # -----------------------------
 # Main Bot Setup
 # -----------------------------
+async def post_init(application: Application):
+    # Build the @mention tag and its matcher once instead of on every group message
+    mention_tag = f"@{(await application.bot.get_me()).username}"
+    application.bot_data["mention_tag"] = mention_tag
+    application.bot_data["mention_re"] = re.compile(rf"(?<![\w@]){re.escape(mention_tag)}(?!\w)", re.IGNORECASE)
+    for _ in range(GEMINI_WORKERS):
+        background_tasks.append(asyncio.create_task(gemini_worker()))
+    background_tasks.append(asyncio.create_task(flush_user_logs()))
+
+async def post_stop(application: Application):
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+# Updates are handled concurrently; the Gemini worker pool still bounds in-flight API calls
+CONCURRENT_UPDATES = 256
+
 def run_bot():
-    root_logger.info("Starting bot...")
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+    app_log.info("Starting bot...")
+    # Queue outgoing calls below Telegram's flood limits instead of retrying after a 429
+    rate_limiter = AIORateLimiter(
+        overall_max_rate=30, overall_time_period=1,
+        group_max_rate=20, group_time_period=60,
+        max_retries=3
+    )
+    app = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .rate_limiter(rate_limiter)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .build()
+    )
     command_handlers = {
         "start": start, "help": help_command, "about": about, "ask": ask,
-        "tip": tip, "example": example, "quiz": quiz, "funfact": funfact,
-        "rules": rules, "replymode": set_reply_mode
+        "replymode": set_reply_mode
     }
+    # Group -1 runs before the handlers below without stopping dispatch to them
+    app.add_handler(TypeHandler(Update, log_update), group=-1)
+    # Only new messages are answered; edited messages have no update.message to reply to
+    new_messages = filters.UpdateType.MESSAGE
     for command, handler in command_handlers.items():
-        app.add_handler(CommandHandler(command, handler))
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    root_logger.info("Bot is running and polling for updates.")
+        app.add_handler(CommandHandler(command, handler, filters=new_messages))
+    app.add_handler(CommandHandler(list(STATIC_PROMPTS), static_prompt, filters=new_messages))
+    app.add_handler(MessageHandler(new_messages & filters.TEXT & ~filters.COMMAND, handle_message))
+    app_log.info("Bot is running and polling for updates.")
     app.run_polling()
 
 # ==============================================================================
-# FLASK WEBSERVER (No changes below this line)
-# ==============================================================================
-flask_app = Flask(__name__)
-flask_app.secret_key = os.urandom(24)
-HOME_DIR = os.getcwd()
-
-# --- Web Request Function ---
-def send_keep_alive_request():
-    """Sends a GET request to the specified URL and logs the result separately."""
-    if not WEB_REQUEST_URL:
-        web_request_logger.warning("WEB_REQUEST_URL is not set. Skipping request.")
-        return
-
-    try:
-        response = requests.get(WEB_REQUEST_URL, timeout=20)
-        web_request_logger.info(
-            f"Sent request to {WEB_REQUEST_URL}. Status: {response.status_code}. Response: {response.text[:100]}"
-        )
-    except requests.exceptions.RequestException as e:
-        web_request_logger.error(f"Failed to send request to {WEB_REQUEST_URL}. Error: {e}")
-
-# --- Login Template ---
-LOGIN_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <title>Login</title>
-    <style>
-        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto; background-color: #121212; color: #e0e0e0; display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; }
-        .login-container { background-color: #1e1e1e; padding: 40px; border-radius: 8px; box-shadow: 0 4px 10px rgba(0,0,0,0.5); text-align: center; }
-        h1 { color: #fff; }
-        input[type="password"] { width: 80%; padding: 10px; margin-top: 20px; border-radius: 5px; border: 1px solid #333; background-color: #222; color: #fff; }
-        button { background-color: #bb86fc; color: #121212; border: none; padding: 10px 20px; border-radius: 5px; cursor: pointer; transition: background-color 0.2s; margin-top: 20px; font-weight: bold; }
-        button:hover { background-color: #a063f0; }
-        .error { color: #cf6679; margin-top: 15px; }
-    </style>
-</head>
-<body>
-    <div class="login-container">
-        <h1>Control Panel Access</h1>
-        <form method="post">
-            <input type="password" name="password" placeholder="Password" required>
-            <br>
-            <button type="submit">Login</button>
-        </form>
-        {% if error %}
-            <p class="error">{{ error }}</p>
-        {% endif %}
-    </div>
-</body>
-</html>
-"""
-
-# --- HTML & JS TEMPLATE (Main Panel) ---
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Bot Control Panel</title>
-    <style>
-        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; margin: 0; background-color: #121212; color: #e0e0e0; display: flex; height: 100vh; }
-        .sidebar { width: 300px; background-color: #1e1e1e; padding: 20px; border-right: 1px solid #333; overflow-y: auto; display: flex; flex-direction: column; }
-        .main-content { flex-grow: 1; display: flex; flex-direction: column; }
-        .log-container { flex-grow: 1; background-color: #181818; padding: 20px; overflow-y: auto; font-family: 'Courier New', Courier, monospace; font-size: 14px; white-space: pre-wrap; }
-        .top-bar { padding: 10px 20px; background-color: #1e1e1e; border-bottom: 1px solid #333; display: flex; justify-content: space-between; align-items: center; }
-        .top-bar-controls { display: flex; gap: 10px; }
-        h1, h2 { color: #ffffff; border-bottom: 1px solid #444; padding-bottom: 10px; }
-        h1 { margin-top: 0; }
-        button { background-color: #333; color: #fff; border: none; padding: 10px 15px; border-radius: 5px; cursor: pointer; transition: background-color 0.2s; margin-bottom: 15px; }
-        button:hover { background-color: #555; }
-        .top-bar button { margin-bottom: 0; }
-        .logout-btn { background-color: #cf6679; margin-top: auto; }
-        .logout-btn:hover { background-color: #b05260; }
-        ul { list-style: none; padding: 0; }
-        li { margin: 5px 0; }
-        a { color: #bb86fc; text-decoration: none; }
-        a:hover { text-decoration: underline; }
-        .file { color: #90caf9; }
-        .dir { color: #a5d6a7; font-weight: bold; }
-        .file-viewer { position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.8); display: none; justify-content: center; align-items: center; }
-        .file-viewer-content { background: #1e1e1e; color: #e0e0e0; width: 80%; height: 80%; padding: 20px; overflow: auto; border: 1px solid #333; font-family: 'Courier New', Courier, monospace;}
-        .close-btn { position: absolute; top: 20px; right: 30px; font-size: 30px; cursor: pointer; }
-    </style>
-</head>
-<body>
-    <div class="sidebar">
-        <div>
-            <h1>File Explorer</h1>
-            <h2>Root: {{ home_dir }}</h2>
-            <a href="/download_zip"><button>Download All as ZIP</button></a>
-            <div id="file-list"></div>
-        </div>
-        <a href="/logout"><button class="logout-btn">Logout</button></a>
-    </div>
-    <div class="main-content">
-        <div class="top-bar">
-            <h2>Live Console Log</h2>
-            <!-- MODIFICATION: Added a container for the buttons -->
-            <div class="top-bar-controls">
-                <button id="clear-log">Clear Console</button>
-                <button id="copy-log">Copy Log</button>
-            </div>
-        </div>
-        <div class="log-container" id="log-content"></div>
-    </div>
-    <div class="file-viewer" id="file-viewer">
-        <span class="close-btn" onclick="closeFileViewer()">&times;</span>
-        <pre id="file-viewer-content" class="file-viewer-content"></pre>
-    </div>
-
-    <script>
-        const logContent = document.getElementById('log-content');
-        
-        // --- Live Log Streaming ---
-        const eventSource = new EventSource('/log_stream');
-        eventSource.onmessage = function(event) {
-            logContent.innerHTML += event.data + '<br>';
-            logContent.scrollTop = logContent.scrollHeight;
-        };
-
-        // --- Copy Log Button ---
-        document.getElementById('copy-log').addEventListener('click', () => {
-            navigator.clipboard.writeText(logContent.innerText).then(() => {
-                alert('Log copied to clipboard!');
-            });
-        });
-
-        // --- MODIFICATION: Added Clear Log Button ---
-        document.getElementById('clear-log').addEventListener('click', () => {
-            logContent.innerHTML = '';
-        });
-
-        // --- File Browser ---
-        function loadFiles(path = '') {
-            fetch(`/files?path=${encodeURIComponent(path)}`)
-                .then(response => {
-                    if (response.status === 401) {
-                        window.location.href = '/login';
-                        return;
-                    }
-                    return response.json();
-                })
-                .then(data => {
-                    if (!data) return;
-                    const fileList = document.getElementById('file-list');
-                    fileList.innerHTML = '';
-                    if (path) {
-                        const parentPath = path.substring(0, path.lastIndexOf('/'));
-                        const upLink = document.createElement('a');
-                        upLink.href = '#';
-                        upLink.className = 'dir';
-                        upLink.textContent = '[..]';
-                        upLink.onclick = (e) => { e.preventDefault(); loadFiles(parentPath); };
-                        fileList.appendChild(document.createElement('li')).appendChild(upLink);
-                    }
-                    data.dirs.forEach(dir => {
-                        const li = document.createElement('li');
-                        const link = document.createElement('a');
-                        link.href = '#';
-                        link.className = 'dir';
-                        link.textContent = dir + '/';
-                        link.onclick = (e) => { e.preventDefault(); loadFiles((path ? path + '/' : '') + dir); };
-                        li.appendChild(link);
-                        fileList.appendChild(li);
-                    });
-                    data.files.forEach(file => {
-                        const li = document.createElement('li');
-                        const fullPath = (path ? path + '/' : '') + file;
-                        
-                        const viewLink = document.createElement('a');
-                        viewLink.href = '#';
-                        viewLink.className = 'file';
-                        viewLink.textContent = file;
-                        viewLink.onclick = (e) => { e.preventDefault(); viewFile(fullPath); };
-                        
-                        const downloadLink = document.createElement('a');
-                        downloadLink.href = `/download/${fullPath}`;
-                        downloadLink.textContent = ' (download)';
-                        downloadLink.style.fontSize = '0.8em';
-
-                        li.appendChild(viewLink);
-                        li.appendChild(downloadLink);
-                        fileList.appendChild(li);
-                    });
-                });
-        }
-        
-        let fileEventSource = null;
-
-        function viewFile(filePath) {
-            const viewer = document.getElementById('file-viewer');
-            const content = document.getElementById('file-viewer-content');
-            viewer.style.display = 'flex';
-            content.textContent = 'Loading...';
-
-            if (fileEventSource) {
-                fileEventSource.close();
-            }
-
-            fileEventSource = new EventSource(`/view/${filePath}`);
-            let fullContent = '';
-            // MODIFICATION: Simplified logic for a continuous stream
-            fileEventSource.onmessage = function(event) {
-                fullContent += event.data + '\\n';
-                content.textContent = fullContent;
-                content.scrollTop = content.scrollHeight; // Auto-scroll
-            };
-            fileEventSource.onerror = function() {
-                content.textContent += '\\n--- End of stream or error ---';
-                fileEventSource.close();
-            }
-        }
-
-        function closeFileViewer() {
-            if (fileEventSource) {
-                fileEventSource.close();
-            }
-            document.getElementById('file-viewer').style.display = 'none';
-        }
-
-        document.addEventListener('DOMContentLoaded', () => loadFiles());
-    </script>
-</body>
-</html>
-"""
-
-# --- Login required decorator ---
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get('logged_in'):
-            if request.path.startswith(('/files', '/log_stream', '/view')):
-                 return jsonify({"error": "Not authenticated"}), 401
-            return redirect(url_for('login', next=request.url))
-        return f(*args, **kwargs)
-    return decorated_function
-
-# --- Flask Routes ---
-@flask_app.route('/login', methods=['GET', 'POST'])
-def login():
-    error = None
-    if request.method == 'POST':
-        if request.form.get('password') == FLASK_PASSWORD:
-            session['logged_in'] = True
-            root_logger.info("Successful login to web panel.")
-            next_url = request.args.get('next')
-            return redirect(next_url or url_for('index'))
-        else:
-            error = 'Invalid password. Please try again.'
-            root_logger.warning("Failed login attempt to web panel.")
-    return render_template_string(LOGIN_TEMPLATE, error=error)
-
-@flask_app.route('/logout')
-def logout():
-    session.pop('logged_in', None)
-    return redirect(url_for('login'))
-
-@flask_app.route('/')
-@login_required
-def index():
-    threading.Thread(target=send_keep_alive_request).start()
-    return render_template_string(HTML_TEMPLATE, home_dir=HOME_DIR)
-
-@flask_app.route('/log_stream')
-@login_required
-def log_stream():
-    log_file_path = os.path.join(LOGS_DIR, "console.log")
-    INITIAL_LOG_LINES = 500
-
-    def generate():
-        try:
-            with open(log_file_path, 'r', encoding='utf-8') as f:
-                # First, send the last N lines of the file
-                initial_lines = deque(f, maxlen=INITIAL_LOG_LINES)
-                for line in initial_lines:
-                    yield f"data: {line.strip()}\n\n"
-                
-                # Then, "tail" the file for new lines
-                while True:
-                    line = f.readline()
-                    if not line:
-                        time.sleep(0.1) # Wait for new content
-                        continue
-                    yield f"data: {line.strip()}\n\n"
-        except FileNotFoundError:
-             yield f"data: ERROR: Log file not found at {log_file_path}\n\n"
-
-    return Response(generate(), mimetype='text/event-stream')
-    
-@flask_app.route('/files')
-@login_required
-def list_files():
-    req_path = request.args.get('path', '')
-    base_path = os.path.join(HOME_DIR, req_path.strip('/'))
-    
-    if not os.path.abspath(base_path).startswith(os.path.abspath(HOME_DIR)):
-        return jsonify({"error": "Access denied"}), 403
-
-    dirs = []
-    files = []
-    try:
-        if os.path.isdir(base_path):
-            for item in os.listdir(base_path):
-                if os.path.isdir(os.path.join(base_path, item)):
-                    dirs.append(item)
-                else:
-                    files.append(item)
-    except FileNotFoundError:
-        return jsonify({"error": "Directory not found"}), 404
-        
-    return jsonify({"path": req_path, "dirs": sorted(dirs), "files": sorted(files)})
-
-@flask_app.route('/view/<path:filepath>')
-@login_required
-def view_file(filepath):
-    abs_path = os.path.join(HOME_DIR, filepath.strip('/'))
-    if not os.path.abspath(abs_path).startswith(os.path.abspath(HOME_DIR)):
-        return "Access Denied", 403
-
-    # MODIFICATION: This function now continuously tails the file
-    def generate():
-        try:
-            with open(abs_path, 'r', encoding='utf-8', errors='ignore') as f:
-                # First, stream all existing content
-                for line in f:
-                    yield f'data: {line.rstrip()}\n\n'
-                
-                # Then, tail the file for new lines
-                while True:
-                    line = f.readline()
-                    if not line:
-                        time.sleep(0.1)
-                        continue
-                    yield f'data: {line.rstrip()}\n\n'
-        except Exception as e:
-            yield f'data: Error reading file: {str(e)}\n\n'
-
-    return Response(generate(), mimetype='text/event-stream')
-
-@flask_app.route('/download/<path:filepath>')
-@login_required
-def download_file(filepath):
-    safe_full_path = os.path.abspath(os.path.join(HOME_DIR, filepath))
-    
-    if not safe_full_path.startswith(os.path.abspath(HOME_DIR)):
-        return "Access Denied: You cannot access files outside the home directory.", 403
-        
-    try:
-        directory = os.path.dirname(safe_full_path)
-        filename = os.path.basename(safe_full_path)
-        return send_from_directory(directory, filename, as_attachment=True)
-    except FileNotFoundError:
-        return "File not found.", 404
-    except Exception as e:
-        root_logger.error(f"Error during file download: {e}", exc_info=True)
-        return "An error occurred while trying to download the file.", 500
-    
-@flask_app.route('/download_zip')
-@login_required
-def download_zip():
-    memory_file = io.BytesIO()
-    excluded_files = ['.env']
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for root, _, files in os.walk(HOME_DIR):
-            for file in files:
-                if file in excluded_files:
-                    continue
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, HOME_DIR)
-                zf.write(file_path, arcname)
-    memory_file.seek(0)
-    return send_file(memory_file, download_name='project_archive.zip', as_attachment=True)
-
-def run_flask():
-    root_logger.info("Starting Flask web server...")
-    # MODIFICATION: Added threaded=True to handle concurrent requests
-    flask_app.run(host='0.0.0.0', port=8080, use_reloader=False, threaded=True)
-
-
-# ==============================================================================
-# FLASK WEBSERVER (No changes below this line)
+# SCRIPT EXECUTION
 # ==============================================================================
+def _init_web():
+    """Imports the web control panel and starts it plus the keep-alive pinger in daemon threads."""
+    import web_panel
 
-# ... (keep all your existing Flask code here) ...
+    # Start the Flask app in its own thread
+    flask_thread = threading.Thread(target=web_panel.run_flask)
+    flask_thread.daemon = True
+    flask_thread.start()
 
-def run_flask():
-    root_logger.info("Starting Flask web server...")
-    flask_app.run(host='0.0.0.0', port=8080, use_reloader=False, threaded=True)
-
-def periodic_web_request():
-    """Runs a keep-alive request every 60 seconds."""
-    while True:
-        send_keep_alive_request()
-        time.sleep(60) # Wait for 60 seconds
+    # Start the periodic web request in its own thread
+    web_request_thread = threading.Thread(target=web_panel.periodic_web_request)
+    web_request_thread.daemon = True
+    web_request_thread.start()
 
-# ==============================================================================
-# SCRIPT EXECUTION
-# ==============================================================================
 if __name__ == "__main__":
     try:
-        # Start the Flask app in its own thread
-        flask_thread = threading.Thread(target=run_flask)
-        flask_thread.daemon = True
-        flask_thread.start()
-
-        # ++ ADD THIS LINE TO START THE PERIODIC REQUEST ++
-        # Start the periodic web request in its own thread
-        web_request_thread = threading.Thread(target=periodic_web_request)
-        web_request_thread.daemon = True
-        web_request_thread.start()
+        if WEB_ENABLED:
+            _init_web()
 
         # Start the bot (this will block the main thread)
         run_bot()
     except Exception as e:
-        root_logger.critical(f"Application failed to start or crashed: {e}", exc_info=True)
\ No newline at end of file
+        app_log.critical(f"Application failed to start or crashed: {e}", exc_info=True)
@@ -0,0 +1,173 @@
+const logContent = document.getElementById('log-content');
+
+// --- Live Log Streaming ---
+// Keep only the newest MAX_DOM_LINES lines and render them as plain text
+const MAX_DOM_LINES = 2000;
+let logLines = [];
+let renderPending = false;
+// Events that arrive within one frame are drawn together in a single textContent write
+function renderLog() {
+    renderPending = false;
+    if (logLines.length > MAX_DOM_LINES) {
+        logLines.splice(0, logLines.length - MAX_DOM_LINES);
+    }
+    logContent.textContent = logLines.join('\n');
+    logContent.scrollTop = logContent.scrollHeight;
+}
+const eventSource = new EventSource('/log_stream');
+eventSource.onmessage = function(event) {
+    logLines.push(...event.data.split('\n'));
+    // rAF doesn't run in background tabs; keep the backlog bounded meanwhile
+    if (logLines.length > 2 * MAX_DOM_LINES) {
+        logLines.splice(0, logLines.length - MAX_DOM_LINES);
+    }
+    if (!renderPending) {
+        renderPending = true;
+        requestAnimationFrame(renderLog);
+    }
+};
+
+// --- Copy Log Button ---
+document.getElementById('copy-log').addEventListener('click', () => {
+    navigator.clipboard.writeText(logContent.innerText).then(() => {
+        alert('Log copied to clipboard!');
+    });
+});
+
+// --- MODIFICATION: Added Clear Log Button ---
+document.getElementById('clear-log').addEventListener('click', () => {
+    logLines = [];
+    logContent.textContent = '';
+});
+
+// --- File Browser ---
+function loadFiles(path = '') {
+    fetch(`/files?path=${encodeURIComponent(path)}`)
+        .then(response => {
+            if (response.status === 401) {
+                window.location.href = '/login';
+                return;
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!data) return;
+            const fileList = document.getElementById('file-list');
+            fileList.innerHTML = '';
+            if (path) {
+                const parentPath = path.substring(0, path.lastIndexOf('/'));
+                const upLink = document.createElement('a');
+                upLink.href = '#';
+                upLink.className = 'dir';
+                upLink.textContent = '[..]';
+                upLink.onclick = (e) => { e.preventDefault(); loadFiles(parentPath); };
+                fileList.appendChild(document.createElement('li')).appendChild(upLink);
+            }
+            data.dirs.forEach(dir => {
+                const li = document.createElement('li');
+                const link = document.createElement('a');
+                link.href = '#';
+                link.className = 'dir';
+                link.textContent = dir + '/';
+                link.onclick = (e) => { e.preventDefault(); loadFiles((path ? path + '/' : '') + dir); };
+                li.appendChild(link);
+                fileList.appendChild(li);
+            });
+            data.files.forEach(file => {
+                const li = document.createElement('li');
+                const fullPath = (path ? path + '/' : '') + file;
+
+                const viewLink = document.createElement('a');
+                viewLink.href = '#';
+                viewLink.className = 'file';
+                viewLink.textContent = file;
+                viewLink.onclick = (e) => { e.preventDefault(); viewFile(fullPath); };
+
+                const downloadLink = document.createElement('a');
+                downloadLink.href = `/download/${fullPath}`;
+                downloadLink.textContent = ' (download)';
+                downloadLink.style.fontSize = '0.8em';
+
+                li.appendChild(viewLink);
+                li.appendChild(downloadLink);
+                fileList.appendChild(li);
+            });
+        });
+}
+
+let fileEventSource = null;
+let viewRequest = 0;
+// Files up to this size that aren't logs are fetched once instead of streamed
+const RAW_VIEW_MAX_BYTES = 1024 * 1024;
+
+function viewFile(filePath) {
+    const viewer = document.getElementById('file-viewer');
+    const content = document.getElementById('file-viewer-content');
+    viewer.style.display = 'flex';
+    content.textContent = 'Loading...';
+
+    if (fileEventSource) {
+        fileEventSource.close();
+        fileEventSource = null;
+    }
+    // Ignore a slow response for a file the user has already navigated away from
+    const request = ++viewRequest;
+
+    // Logs keep growing, so they are always tailed live
+    if (/\.log(\.\d+)?$/.test(filePath)) {
+        streamFile(filePath, content);
+        return;
+    }
+    const rawUrl = `/view_raw/${filePath}`;
+    fetch(rawUrl, { method: 'HEAD' })
+        .then(response => {
+            if (request !== viewRequest) return;
+            if (response.status === 401) {
+                window.location.href = '/login';
+                return;
+            }
+            const size = Number(response.headers.get('Content-Length'));
+            if (!response.ok || size > RAW_VIEW_MAX_BYTES) {
+                streamFile(filePath, content);
+                return;
+            }
+            return fetch(rawUrl)
+                .then(response => response.text())
+                .then(text => {
+                    if (request === viewRequest) content.textContent = text;
+                });
+        })
+        .catch(() => {
+            if (request === viewRequest) streamFile(filePath, content);
+        });
+}
+
+function streamFile(filePath, content) {
+    fileEventSource = new EventSource(`/view/${filePath}`);
+    let loading = true;
+    // MODIFICATION: Simplified logic for a continuous stream
+    // Each event carries a batch of lines; append it as one text node instead of
+    // re-rendering everything received so far
+    fileEventSource.onmessage = function(event) {
+        if (loading) {
+            content.textContent = '';
+            loading = false;
+        }
+        content.appendChild(document.createTextNode(event.data + '\n'));
+        content.scrollTop = content.scrollHeight; // Auto-scroll
+    };
+    fileEventSource.onerror = function() {
+        content.textContent += '\n--- End of stream or error ---';
+        fileEventSource.close();
+    }
+}
+
+function closeFileViewer() {
+    viewRequest++;
+    if (fileEventSource) {
+        fileEventSource.close();
+    }
+    document.getElementById('file-viewer').style.display = 'none';
+}
+
+document.addEventListener('DOMContentLoaded', () => loadFiles());
@@ -0,0 +1,836 @@
+import gzip
+import hashlib
+import hmac
+import io
+import os
+import time
+import logging
+import queue
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+import zipfile
+import zlib
+from collections import deque
+from functools import lru_cache, wraps
+from typing import Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, jsonify, send_file, send_from_directory, request, redirect, url_for, session
+from waitress import serve
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError: # Not on Linux (or not installed): followers fall back to polling
+    INotify = None
+
+try:
+    import orjson
+except ImportError: # Listings are serialized with the stdlib json instead
+    orjson = None
+
+from config import (
+    FLASK_PASSWORD, FLASK_SECRET_KEY, LOGS_DIR, SESSION_COOKIE_SECURE, USE_X_SENDFILE, WEB_PORT, WEB_REQUEST_URL,
+    WEB_THREADS, ZIP_CACHE_DIR,
+)
+
+# -----------------------------
+# Web Control Panel
+# -----------------------------
+# Imported by main.py only when WEB_ENABLED is on, so the bot can start without loading Flask.
+app_log = logging.getLogger("bot")
+web_request_logger = logging.getLogger('WebRequestLogger')
+
+# static/ assets are versioned in their URLs, so browsers may keep them for a day
+STATIC_MAX_AGE = 86400
+
+class PanelFlask(Flask):
+    """Flask app whose cache lifetime applies to static/ only; SEND_FILE_MAX_AGE_DEFAULT
+    would also reach /download and /view_raw, where files change under the same URL."""
+
+    def send_static_file(self, filename: str) -> Response:
+        return send_from_directory(self.static_folder, filename, max_age=STATIC_MAX_AGE)
+
+flask_app = PanelFlask(__name__)
+# Falls back to a per-process random key, which logs everyone out on restart
+flask_app.secret_key = FLASK_SECRET_KEY or os.urandom(32)
+flask_app.config.update(
+    SESSION_COOKIE_SECURE=SESSION_COOKIE_SECURE,
+    SESSION_COOKIE_HTTPONLY=True,
+    PERMANENT_SESSION_LIFETIME=3600,
+    USE_X_SENDFILE=USE_X_SENDFILE,
+)
+HOME_DIR = os.getcwd()
+# Resolved once; request paths are resolved the same way so symlinks can't point outside it
+HOME_ABS = os.path.realpath(HOME_DIR)
+HOME_PREFIX = os.path.join(HOME_ABS, '') # With a trailing separator, so /home/app2 doesn't match /home/app
+
+def is_within(real_path: str, prefix: str) -> bool:
+    """Whether a resolved path is the directory prefix (ending in os.sep) or lies under it."""
+    return (real_path + os.sep).startswith(prefix)
+
+# --- Web Request Function ---
+# One pooled connection reused across pings instead of a new TCP/TLS handshake each time
+keep_alive_session = requests.Session()
+keep_alive_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+keep_alive_session.mount('http://', keep_alive_adapter)
+keep_alive_session.mount('https://', keep_alive_adapter)
+# Pinged only from the single periodic_web_request thread, so page loads cost no thread
+KEEP_ALIVE_INTERVAL = 60
+
+def send_keep_alive_request():
+    """Sends a GET request to the specified URL and logs the result separately."""
+    if not WEB_REQUEST_URL:
+        web_request_logger.warning("WEB_REQUEST_URL is not set. Skipping request.")
+        return
+
+    try:
+        response = keep_alive_session.get(WEB_REQUEST_URL, timeout=20)
+        web_request_logger.info(
+            f"Sent request to {WEB_REQUEST_URL}. Status: {response.status_code}. Response: {response.text[:100]}"
+        )
+    except requests.exceptions.RequestException as e:
+        web_request_logger.error(f"Failed to send request to {WEB_REQUEST_URL}. Error: {e}")
+
+# --- File Change Notification ---
+class FileWatcher:
+    """
+    Blocks until a file may have changed. Uses inotify on its directory where available,
+    so rotation (a new file under the same name) is seen too; otherwise sleeps briefly.
+    """
+
+    POLL_INTERVAL = 0.1
+    WATCH_FLAGS = (inotify_flags.MODIFY | inotify_flags.CREATE | inotify_flags.MOVED_TO) if INotify else 0
+
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        self.inotify = None
+        if INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(os.path.dirname(path) or '.', self.WATCH_FLAGS)
+            except OSError as e: # e.g. the per-user inotify instance limit
+                app_log.warning(f"inotify unavailable for {path}, polling instead: {e}")
+                self.close()
+
+    def wait(self, timeout: float):
+        """Returns once the file is touched, or after timeout seconds at the latest."""
+        if self.inotify is None:
+            time.sleep(self.POLL_INTERVAL)
+            return
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            # Other files in the directory (e.g. user logs) wake us too; ignore them
+            if any(event.name == self.name for event in self.inotify.read(timeout=int(remaining * 1000))):
+                return
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+# --- Console Log Tail ---
+class LogTail:
+    """
+    Follows a log file on one background thread, keeping its last lines in memory
+    and fanning new lines out to every subscriber.
+    """
+
+    # Upper bound on a wait, so a missed notification only delays lines rather than losing them
+    WAIT_TIMEOUT = 1.0
+    SUBSCRIBER_BACKLOG = 10000
+    READ_BLOCK = 64 * 1024
+
+    def __init__(self, path: str, recent_lines: int):
+        self.path = path
+        self.recent = deque(maxlen=recent_lines)
+        self.subscribers: set[queue.Queue] = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self) -> tuple[list[str], queue.Queue]:
+        """Returns a snapshot of the recent lines plus a queue that receives every line after it."""
+        subscriber = queue.Queue(maxsize=self.SUBSCRIBER_BACKLOG)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._follow, args=(self._open_at_end(),), daemon=True)
+                self.thread.start()
+            self.subscribers.add(subscriber)
+            return list(self.recent), subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _open(self):
+        f = open(self.path, 'rb')
+        if hasattr(os, 'posix_fadvise'):
+            # Read front to back from here on: let the kernel read ahead
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        return f
+
+    def _open_at_end(self):
+        # Seed the recent lines from the end of the file, reading backwards in blocks only
+        # until there are enough of them, and leave f just after the last complete line
+        try:
+            f = self._open()
+        except FileNotFoundError:
+            return None
+        end = f.seek(0, os.SEEK_END)
+        pos, data = end, b''
+        while pos > 0 and data.count(b'\n') <= self.recent.maxlen:
+            step = min(self.READ_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+        last_newline = data.rfind(b'\n')
+        lines = data[:last_newline].split(b'\n') if last_newline >= 0 else []
+        if pos > 0:
+            lines = lines[1:] # Cut mid-line by the last block read
+        self.recent.extend(line.decode('utf-8', 'ignore') for line in lines[-self.recent.maxlen:])
+        # An unterminated last line is left for _follow to pick up once it's complete
+        f.seek(pos + last_newline + 1)
+        return f
+
+    def _publish(self, line: str):
+        with self.lock:
+            self.recent.append(line)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(line)
+            except queue.Full:
+                pass # A stalled viewer misses lines rather than holding up everyone else
+
+    def _follow(self, f):
+        watcher = FileWatcher(self.path)
+        partial = b''
+        inode = os.fstat(f.fileno()).st_ino if f else None
+        while True:
+            if f is None:
+                try:
+                    f = self._open()
+                except FileNotFoundError:
+                    watcher.wait(self.WAIT_TIMEOUT)
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+            line = f.readline()
+            if line:
+                if not line.endswith(b'\n'):
+                    partial += line # The writer hasn't finished this line yet
+                    continue
+                self._publish((partial + line).rstrip(b'\n').decode('utf-8', 'ignore'))
+                partial = b''
+                continue
+            # At EOF: reopen from the start if RotatingFileHandler has swapped the file out
+            try:
+                st = os.stat(self.path)
+                rotated = st.st_ino != inode or st.st_size < f.tell()
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                f.close()
+                f = None
+                continue
+            watcher.wait(self.WAIT_TIMEOUT)
+
+INITIAL_LOG_LINES = 500
+console_tail = LogTail(os.path.join(LOGS_DIR, "console.log"), INITIAL_LOG_LINES)
+# Sent on a quiet stream (console or /view) so a disconnected viewer is noticed and its thread freed
+SSE_KEEPALIVE_INTERVAL = 15
+SSE_KEEPALIVE = b": keep-alive\n\n"
+
+# --- SSE Batching ---
+# Lines are packed into one event per 50 ms / 64 KiB instead of one event per line
+SSE_BATCH_WINDOW = 0.05
+SSE_BATCH_BYTES = 64 * 1024
+
+def sse_event(lines: list[str]) -> bytes:
+    """Packs lines into a single multi-line SSE event; the browser rejoins them with '\\n' in event.data."""
+    # Encoded here, once per event, so the server just writes the bytes out
+    return ("data: " + "\ndata: ".join(lines) + "\n\n").encode()
+
+def batched_events(lines: Iterable[str]) -> Iterator[bytes]:
+    batch, size = [], 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= SSE_BATCH_BYTES:
+            yield sse_event(batch)
+            batch, size = [], 0
+    if batch:
+        yield sse_event(batch)
+
+# --- SSE Compression ---
+# Log text compresses several-fold; each event is sync-flushed so the browser can decode it
+# as soon as it arrives, and level 1 keeps the per-viewer CPU cost low
+def gzip_stream(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31) # wbits=31: gzip framing
+    try:
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        chunks.close()
+
+def sse_response(events: Iterator[bytes]) -> Response:
+    headers = {
+        'Cache-Control': 'no-cache, no-transform',
+        'X-Accel-Buffering': 'no', # Tells nginx not to hold events back in its buffer
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        events = gzip_stream(events)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(events, mimetype='text/event-stream', headers=headers, direct_passthrough=True)
+
+# --- ZIP Streaming ---
+# The archive is written into an unseekable sink and handed to the client piece by piece,
+# so memory stays at one read chunk plus the deflate window however large the tree is
+ZIP_CHUNK_SIZE = 64 * 1024
+# Names left out of the download; directories among them are skipped without being walked
+ZIP_EXCLUDED = frozenset({'.env', '.git', '__pycache__', 'node_modules'})
+# Fastest deflate level: source and logs still shrink well, at a fraction of level 6's CPU
+ZIP_COMPRESSLEVEL = 1
+
+class ZipSink(io.RawIOBase):
+    """Write-only stream that collects zipfile output until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _walk_files(root: str, excluded: frozenset[str]) -> Iterator[os.DirEntry]:
+    """Recursively yields the files under root from scandir, reusing its d_type instead of a stat per entry."""
+    try:
+        with os.scandir(root) as it:
+            for entry in it:
+                if entry.name in excluded:
+                    continue # Excluded directories are skipped whole, without recursing into them
+                # Directory symlinks aren't descended into, like os.walk
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _walk_files(entry.path, excluded)
+                elif entry.is_file():
+                    yield entry
+    except OSError as e:
+        app_log.warning(f"Skipping {root} in ZIP download: {e}")
+
+def iter_archive_files(base_dir: str, excluded: frozenset[str]) -> Iterator[tuple[os.DirEntry, str]]:
+    """Yields (entry, arcname) for the files to archive, skipping symlinks that resolve outside base_dir."""
+    base_prefix = os.path.join(os.path.realpath(base_dir), '')
+    for entry in _walk_files(base_dir, excluded):
+        # Only symlinks can lead outside, so only they pay for a realpath()
+        if entry.is_symlink() and not is_within(os.path.realpath(entry.path), base_prefix):
+            continue
+        yield entry, os.path.relpath(entry.path, base_dir)
+
+def iter_zip(base_dir: str, excluded: frozenset[str]) -> Iterator[bytes]:
+    sink = ZipSink()
+    # zipfile can't seek back on the sink, so it writes sizes in data descriptors instead
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED, compresslevel=ZIP_COMPRESSLEVEL) as zf:
+        for entry, arcname in iter_archive_files(base_dir, excluded):
+            file_path = entry.path
+            try:
+                src = open(file_path, 'rb')
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+            except OSError as e:
+                app_log.warning(f"Skipping {file_path} in ZIP download: {e}")
+                continue
+            # What ZipFile.write() does with its own settings; open() takes them from zinfo
+            zinfo.compress_type = zf.compression
+            zinfo._compresslevel = zf.compresslevel
+            with src, zf.open(zinfo, 'w') as dest:
+                while chunk := src.read(ZIP_CHUNK_SIZE):
+                    dest.write(chunk)
+                    if data := sink.drain():
+                        yield data
+            # Closing the entry writes its data descriptor
+            if data := sink.drain():
+                yield data
+    # Closing the archive writes the central directory
+    yield sink.drain()
+
+# Deflate is CPU-bound; when Info-ZIP is installed it runs in its own process and the
+# serving thread only copies its stdout, so SSE viewers on the same process keep up
+ZIP_BINARY = shutil.which('zip')
+# Info-ZIP's "couldn't open some input files" status: those files are left out and the
+# archive is still complete, like the in-process writer skipping an unreadable file
+ZIP_EXIT_SKIPPED_FILES = 18
+
+def iter_zip_subprocess(base_dir: str, excluded: frozenset[str]) -> Iterator[bytes]:
+    # zip follows symlinks when streaming to a pipe, so it is given the same vetted
+    # file list as the in-process writer (one name per line on stdin) instead of -r
+    with tempfile.TemporaryFile() as names:
+        for _, arcname in iter_archive_files(base_dir, excluded):
+            if '\n' not in arcname:
+                names.write(os.fsencode(arcname) + b'\n')
+        if not names.tell():
+            # zip refuses an empty list ("nothing to do"); the in-process writer
+            # produces an empty archive instead
+            yield from iter_zip(base_dir, excluded)
+            return
+        names.seek(0)
+        proc = subprocess.Popen(
+            [ZIP_BINARY, '-q', f'-{ZIP_COMPRESSLEVEL}', '-D', '-@', '-'],
+            cwd=base_dir, stdin=names, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+    try:
+        while chunk := proc.stdout.read(ZIP_CHUNK_SIZE):
+            yield chunk
+        # A zip that died partway also ends its stdout; raising aborts the response
+        # instead of finishing a truncated archive as if it were complete
+        returncode = proc.wait()
+        if returncode == ZIP_EXIT_SKIPPED_FILES:
+            app_log.warning("Some files could not be read and were left out of the ZIP download.")
+        elif returncode != 0:
+            raise subprocess.CalledProcessError(returncode, ZIP_BINARY)
+    finally:
+        # Client went away mid-download: don't leave zip running
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+# --- ZIP Cache ---
+# When ZIP_CACHE_DIR is set, finished archives are kept there under a digest of every
+# file's name, size and mtime; an unchanged tree is then served straight from disk without
+# compressing anything. Archives hold every chat log, so the directory must be private,
+# and the cache is best-effort: any I/O error just means the download isn't cached.
+ZIP_CACHE_VERSIONS = 2
+# Resolved once, like HOME_ABS, so a relative setting can't drift with the cwd
+ZIP_CACHE_ROOT = os.path.realpath(ZIP_CACHE_DIR) if ZIP_CACHE_DIR else None
+
+def zip_cache_ready() -> bool:
+    """Creates ZIP_CACHE_ROOT if needed and checks that it is a directory only this user can reach."""
+    # Inside the archived tree, each build would archive the earlier ones (and its own
+    # temp file) and change the digest, so the cache would only grow and never hit
+    if is_within(ZIP_CACHE_ROOT, HOME_PREFIX):
+        app_log.warning(f"ZIP cache disabled: {ZIP_CACHE_ROOT} is inside the archived directory {HOME_ABS}")
+        return False
+    try:
+        os.makedirs(ZIP_CACHE_ROOT, mode=0o700, exist_ok=True)
+        st = os.lstat(ZIP_CACHE_ROOT)
+    except OSError as e:
+        app_log.warning(f"ZIP cache disabled: {e}")
+        return False
+    # exist_ok also accepts a directory someone else created first
+    if not stat.S_ISDIR(st.st_mode) or st.st_mode & 0o077 or (hasattr(os, 'getuid') and st.st_uid != os.getuid()):
+        app_log.warning(f"ZIP cache disabled: {ZIP_CACHE_ROOT} is not a private directory owned by this user")
+        return False
+    return True
+
+def archive_digest(base_dir: str, excluded: frozenset[str]) -> str:
+    digest = hashlib.sha1()
+    for entry, arcname in iter_archive_files(base_dir, excluded):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        digest.update(f"{arcname}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+def prune_zip_cache():
+    archives = [entry for entry in os.scandir(ZIP_CACHE_ROOT) if entry.name.endswith('.zip')]
+    archives.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in archives[ZIP_CACHE_VERSIONS:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+def tee_to_cache(chunks: Iterator[bytes], cache_path: str) -> Iterator[bytes]:
+    """Streams chunks to the client while saving them; only a complete archive enters the cache."""
+    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+    cache_file = None
+    try:
+        cache_file = os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb')
+    except OSError as e:
+        app_log.warning(f"Not caching ZIP download: {e}")
+    try:
+        for chunk in chunks:
+            if cache_file:
+                try:
+                    cache_file.write(chunk)
+                except OSError as e:
+                    # Full disk and the like: the client still gets the whole archive
+                    app_log.warning(f"Not caching ZIP download: {e}")
+                    cache_file.close()
+                    cache_file = None
+            yield chunk
+        # Only reached when the stream ended cleanly; a failed zip raises above
+        if cache_file:
+            try:
+                cache_file.close()
+                cache_file = None
+                os.replace(tmp_path, cache_path)
+                prune_zip_cache()
+            except OSError as e:
+                app_log.warning(f"Not caching ZIP download: {e}")
+    finally:
+        chunks.close() # Stops a zip subprocess if the client went away
+        if cache_file:
+            cache_file.close()
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+# --- Login Template ---
+LOGIN_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Login</title>
+    <link rel="stylesheet" href="/static/login.css?v={{ static_version }}">
+</head>
+<body>
+    <div class="login-container">
+        <h1>Control Panel Access</h1>
+        <form method="post">
+            <input type="password" name="password" placeholder="Password" required>
+            <br>
+            <button type="submit">Login</button>
+        </form>
+        {% if error %}
+            <p class="error">{{ error }}</p>
+        {% endif %}
+    </div>
+</body>
+</html>
+"""
+
+# --- HTML TEMPLATE (Main Panel) ---
+# Styles and scripts live in static/ so browsers cache them across page loads
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Bot Control Panel</title>
+    <link rel="stylesheet" href="/static/panel.css?v={{ static_version }}">
+    <script src="/static/panel.js?v={{ static_version }}" defer></script>
+</head>
+<body>
+    <div class="sidebar">
+        <div>
+            <h1>File Explorer</h1>
+            <h2>Root: {{ home_dir }}</h2>
+            <a href="/download_zip"><button>Download All as ZIP</button></a>
+            <div id="file-list"></div>
+        </div>
+        <a href="/logout"><button class="logout-btn">Logout</button></a>
+    </div>
+    <div class="main-content">
+        <div class="top-bar">
+            <h2>Live Console Log</h2>
+            <!-- MODIFICATION: Added a container for the buttons -->
+            <div class="top-bar-controls">
+                <button id="clear-log">Clear Console</button>
+                <button id="copy-log">Copy Log</button>
+            </div>
+        </div>
+        <div class="log-container" id="log-content"></div>
+    </div>
+    <div class="file-viewer" id="file-viewer">
+        <span class="close-btn" onclick="closeFileViewer()">&times;</span>
+        <pre id="file-viewer-content" class="file-viewer-content"></pre>
+    </div>
+</body>
+</html>
+"""
+
+# Compiled once at import instead of re-parsing the template string on every request.
+# The pages have no per-request inputs, so they are rendered (and gzipped) to bytes up front as well.
+# Asset URLs carry the newest static/ mtime, so an edited file is fetched again despite the max-age.
+STATIC_VERSION = max(int(entry.stat().st_mtime) for entry in os.scandir(flask_app.static_folder))
+LOGIN_TPL = flask_app.jinja_env.from_string(LOGIN_TEMPLATE)
+INDEX_HTML = flask_app.jinja_env.from_string(HTML_TEMPLATE).render(home_dir=HOME_DIR, static_version=STATIC_VERSION).encode()
+LOGIN_ERROR = 'Invalid password. Please try again.'
+
+def prepare_page(html: bytes) -> tuple[bytes, bytes]:
+    """Returns the page body alongside its gzip encoding, compressed once at maximum level."""
+    return html, gzip.compress(html, 9, mtime=0)
+
+def page_response(page: tuple[bytes, bytes], headers: dict | None = None) -> Response:
+    """Serves a prepared page, gzipped when the client accepts it."""
+    html, html_gz = page
+    headers = {**(headers or {}), 'Vary': 'Accept-Encoding'}
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return Response(html_gz, mimetype='text/html', headers=headers)
+    return Response(html, mimetype='text/html', headers=headers)
+
+INDEX_PAGE = prepare_page(INDEX_HTML)
+# The login form only ever renders with no error or the failed-password one
+LOGIN_PAGES = {
+    error: prepare_page(LOGIN_TPL.render(error=error, static_version=STATIC_VERSION).encode())
+    for error in (None, LOGIN_ERROR)
+}
+
+# Only the digest is kept for login checks; comparing fixed-size digests with
+# compare_digest takes the same time however many leading bytes match
+PASSWORD_DIGEST = hashlib.sha256(FLASK_PASSWORD.encode()).digest() if FLASK_PASSWORD else None
+
+def resolve_in_home(rel_path: str) -> str | None:
+    """Returns the real path of rel_path under HOME_ABS, or None if it escapes the home directory."""
+    target = os.path.realpath(os.path.join(HOME_ABS, rel_path.strip('/')))
+    if not is_within(target, HOME_PREFIX):
+        return None
+    return target
+
+# --- Login required decorator ---
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('logged_in'):
+            if request.path.startswith(('/files', '/log_stream', '/view')):
+                 return jsonify({"error": "Not authenticated"}), 401
+            return redirect(url_for('login', next=request.url))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# --- Flask Routes ---
+@flask_app.route('/login', methods=['GET', 'POST'])
+def login():
+    error = None
+    if request.method == 'POST':
+        password = request.form.get('password', '').encode()
+        if PASSWORD_DIGEST and hmac.compare_digest(hashlib.sha256(password).digest(), PASSWORD_DIGEST):
+            session.permanent = True
+            session['logged_in'] = True
+            app_log.info("Successful login to web panel.")
+            next_url = request.args.get('next')
+            return redirect(next_url or url_for('index'))
+        else:
+            error = LOGIN_ERROR
+            app_log.warning("Failed login attempt to web panel.")
+    return page_response(LOGIN_PAGES[error])
+
+@flask_app.route('/logout')
+def logout():
+    session.pop('logged_in', None)
+    return redirect(url_for('login'))
+
+@flask_app.route('/')
+@login_required
+def index():
+    # The page is a fixed shell (all data comes from /files and the streams), so the
+    # browser may reuse it for a few minutes; private keeps shared proxies from storing it
+    return page_response(INDEX_PAGE, {'Cache-Control': 'private, max-age=300'})
+
+@flask_app.route('/log_stream')
+@login_required
+def log_stream():
+    def generate():
+        # Replay the in-memory recent lines, then wait on the shared tail for new ones
+        initial_lines, subscriber = console_tail.subscribe()
+        try:
+            yield from batched_events(line.strip() for line in initial_lines)
+            while True:
+                try:
+                    line = subscriber.get(timeout=SSE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield SSE_KEEPALIVE
+                    continue
+                # Collect whatever else arrives within the batch window into the same event
+                batch = [line.strip()]
+                size = len(line)
+                deadline = time.monotonic() + SSE_BATCH_WINDOW
+                while size < SSE_BATCH_BYTES:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        line = subscriber.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(line.strip())
+                    size += len(line)
+                yield sse_event(batch)
+        finally:
+            console_tail.unsubscribe(subscriber)
+
+    return sse_response(generate())
+    
+@lru_cache(maxsize=256)
+def _list_dir(abs_path: str, mtime_ns: int) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    dirs = []
+    files = []
+    # One scandir pass: DirEntry.is_dir() uses the d_type from readdir
+    # instead of a stat() per entry, and no joined path is built for it.
+    # Symlinks are still followed (one stat each) so a linked directory
+    # browses as a directory; resolve_in_home vets where it points.
+    with os.scandir(abs_path) as it:
+        for entry in it:
+            (dirs if entry.is_dir() else files).append(entry.name)
+    # Sorted once here, case-insensitively, so cache hits are returned as-is
+    return tuple(sorted(dirs, key=str.lower)), tuple(sorted(files, key=str.lower))
+
+@flask_app.route('/files')
+@login_required
+def list_files():
+    req_path = request.args.get('path', '')
+    base_path = resolve_in_home(req_path)
+    if base_path is None:
+        return jsonify({"error": "Access denied"}), 403
+
+    try:
+        # The mtime changes whenever an entry is added, removed or renamed, so it keys the
+        # cache and a stale listing is never served
+        dirs, files = _list_dir(base_path, os.stat(base_path).st_mtime_ns)
+    except NotADirectoryError:
+        dirs, files = (), ()
+    except FileNotFoundError:
+        return jsonify({"error": "Directory not found"}), 404
+    except PermissionError:
+        return jsonify({"error": "Permission denied"}), 403
+
+    listing = {"path": req_path, "dirs": dirs, "files": files}
+    if orjson is None:
+        return jsonify(listing)
+    # Directories with thousands of entries make stdlib json show up in profiles
+    return Response(orjson.dumps(listing), mimetype='application/json')
+
+@flask_app.route('/view/<path:filepath>')
+@login_required
+def view_file(filepath):
+    abs_path = resolve_in_home(filepath)
+    if abs_path is None:
+        return "Access Denied", 403
+
+    # MODIFICATION: This function now continuously tails the file
+    def generate():
+        # Wakes the tail loop when the file is written instead of polling it
+        watcher = FileWatcher(abs_path)
+        fd = None
+        try:
+            # Unbuffered 64 KiB os.read() calls, one multi-line event per block; only whole
+            # lines are decoded, so a block boundary never splits a line or a UTF-8 sequence
+            fd = os.open(abs_path, os.O_RDONLY)
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            pending = b''
+            last_sent = time.monotonic()
+            while True:
+                block = os.read(fd, SSE_BATCH_BYTES)
+                if block:
+                    pending += block
+                    end = pending.rfind(b'\n')
+                    if end < 0:
+                        continue
+                    data, pending = pending[:end], pending[end + 1:]
+                elif pending:
+                    # At EOF, send an unterminated last line as is
+                    data, pending = pending, b''
+                else:
+                    # A closed viewer is only noticed when a write fails, so keep writing
+                    # to a quiet file; otherwise it would hold its worker thread indefinitely
+                    if time.monotonic() - last_sent >= SSE_KEEPALIVE_INTERVAL:
+                        yield SSE_KEEPALIVE
+                        last_sent = time.monotonic()
+                    watcher.wait(LogTail.WAIT_TIMEOUT)
+                    continue
+                # A bare CR would end an SSE line early, so drop them
+                text = data.decode('utf-8', 'ignore').replace('\r', '')
+                yield sse_event(text.split('\n'))
+                last_sent = time.monotonic()
+        except Exception as e:
+            yield sse_event([f'Error reading file: {str(e)}'])
+        finally:
+            watcher.close()
+            if fd is not None:
+                os.close(fd)
+
+    return sse_response(generate())
+
+@flask_app.route('/view_raw/<path:filepath>')
+@login_required
+def view_file_raw(filepath):
+    # Static files are fetched in one plain response (sendfile, ETag/304) instead of
+    # holding an SSE stream open; /view stays for files that are still being written
+    abs_path = resolve_in_home(filepath)
+    if abs_path is None:
+        return "Access Denied", 403
+    try:
+        return send_from_directory(
+            os.path.dirname(abs_path), os.path.basename(abs_path), mimetype='text/plain', conditional=True, max_age=0
+        )
+    except FileNotFoundError:
+        return "File not found.", 404
+
+@flask_app.route('/download/<path:filepath>')
+@login_required
+def download_file(filepath):
+    safe_full_path = resolve_in_home(filepath)
+    if safe_full_path is None:
+        return "Access Denied: You cannot access files outside the home directory.", 403
+        
+    try:
+        directory = os.path.dirname(safe_full_path)
+        filename = os.path.basename(safe_full_path)
+        # Range/If-None-Match support for resuming and revalidating. Files like logs change
+        # under the same URL, so max_age=0 pins revalidation here whatever the app-wide default
+        return send_from_directory(directory, filename, as_attachment=True, conditional=True, max_age=0)
+    except FileNotFoundError:
+        return "File not found.", 404
+    except Exception as e:
+        app_log.error(f"Error during file download: {e}", exc_info=True)
+        return "An error occurred while trying to download the file.", 500
+    
+@flask_app.route('/download_zip')
+@login_required
+def download_zip():
+    stream = (iter_zip_subprocess if ZIP_BINARY else iter_zip)(HOME_DIR, ZIP_EXCLUDED)
+    if ZIP_CACHE_ROOT and zip_cache_ready():
+        cache_path = os.path.join(ZIP_CACHE_ROOT, f"project_archive_{archive_digest(HOME_DIR, ZIP_EXCLUDED)}.zip")
+        try:
+            return send_file(
+                cache_path, mimetype='application/zip', as_attachment=True, download_name='project_archive.zip', max_age=0
+            )
+        except OSError: # Not cached yet (or pruned meanwhile): build it and save a copy
+            stream = tee_to_cache(stream, cache_path)
+    return Response(
+        stream,
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=project_archive.zip'},
+    )
+
+def run_flask():
+    app_log.info("Starting Flask web server...")
+    # Waitress instead of the Werkzeug dev server: a fixed worker pool, so idle or
+    # long-lived SSE viewers can't spawn an unbounded number of threads
+    # poll() rather than select() so the I/O loop isn't capped at 1024 file descriptors
+    serve(flask_app, host='0.0.0.0', port=WEB_PORT, threads=WEB_THREADS, asyncore_use_poll=True)
+
+def periodic_web_request():
+    """Runs a keep-alive request every KEEP_ALIVE_INTERVAL seconds."""
+    while True:
+        send_keep_alive_request()
+        time.sleep(KEEP_ALIVE_INTERVAL)
+
+if __name__ == "__main__":
+    # Standalone mode: run the panel as its own process next to a bot started with
+    # WEB_ENABLED=false, so request threads and the bot's event loop don't share a GIL.
+    # The panel only reads the bot's files (logs/console.log), so nothing else is shared.
+    if not FLASK_PASSWORD:
+        print("FATAL ERROR: FLASK_PASSWORD must be set in the .env file.")
+        exit()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    threading.Thread(target=periodic_web_request, daemon=True).start()
+    run_flask()